@@ -1,11 +1,9 @@
 import discord
 from discord.ext import commands
 import logging
-from datetime import datetime
-import json
 from asyncio import TimeoutError
-import sqlite3
 from database import get_connection
+from config import load_config
 from ext.constants import Balance, TransactionError, CURRENCY_RATES
 from ext.balance_manager import BalanceManager
 
@@ -15,42 +13,42 @@ class AdminCog(commands.Cog, name="Admin"):
         self._init_logger()
         self.balance_manager = BalanceManager(bot)
         
-        print(f"Current Date and Time (UTC - YYYY-MM-DD HH:MM:SS formatted): {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}")
-        
         # Load admin ID from config.json
         try:
-            with open('config.json') as f:
-                config = json.load(f)
-                self.admin_id = int(config['admin_id'])
-                self.logger.info(f"Admin ID loaded: {self.admin_id}")
+            self.admin_id = int(load_config()['admin_id'])
+            self.logger.info(f"Admin ID loaded: {self.admin_id}")
         except Exception as e:
             self.logger.error(f"Failed to load admin_id: {e}")
             raise
 
     def _init_logger(self):
+        # Output goes through the root handler configured in main.py
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-
-    async def _check_admin(self, ctx):
-        """Check if user has admin permissions"""
-        is_admin = ctx.author.id == self.admin_id
-        if not is_admin:
-            await ctx.send("❌ You are not authorized to use admin commands!")
-            self.logger.warning(f"Unauthorized access attempt by {ctx.author} (ID: {ctx.author.id})")
-        else:
-            self.logger.info(f"Admin command used by {ctx.author} (ID: {ctx.author.id})")
-        return is_admin
+
+    async def cog_check(self, ctx):
+        """Only the configured admin may use this cog's commands"""
+        if ctx.author.id == self.admin_id:
+            return True
+        # on_command_error answers the resulting CheckFailure
+        self.logger.warning(f"Unauthorized access attempt by {ctx.author} (ID: {ctx.author.id})")
+        return False
+
+    def _invalidate_product(self, code: str):
+        """Drop ProductManager's cached reads after a direct product write"""
+        product_manager = self.bot.get_cog('ProductManagerCog')
+        if product_manager:
+            product_manager.product_manager.invalidate(code)
+
+    def _invalidate_balance(self, growid: str):
+        """Drop the live panel's cached balance embed after a direct balance write"""
+        live_stock = self.bot.get_cog('LiveStock')
+        if live_stock:
+            live_stock.stock_view.invalidate_balance(growid)
 
     @commands.command(name="adminhelp")
     async def admin_help(self, ctx):
         """Show admin commands"""
-        if not await self._check_admin(ctx):
-            return
-            
         embed = discord.Embed(
             title="Admin Commands",
             description="Available admin commands:",
@@ -90,26 +88,25 @@ class AdminCog(commands.Cog, name="Admin"):
     @commands.command(name="addproduct")
     async def add_product(self, ctx, code: str, name: str, price: int, *, description: str = "No description"):
         """Add a new product"""
-        if not await self._check_admin(ctx):
-            return
-            
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            # Check if product exists
-            cursor.execute("SELECT code FROM products WHERE code = ?", (code,))
-            if cursor.fetchone():
+            async with self.bot.db_pool.writer() as conn:
+                # Check if product exists
+                cursor = await conn.execute(
+                    "SELECT code FROM products WHERE code = ?", (code,)
+                )
+                exists = await cursor.fetchone() is not None
+                if not exists:
+                    # Add product
+                    await conn.execute("""
+                        INSERT INTO products (code, name, price, description, stock)
+                        VALUES (?, ?, ?, ?, 0)
+                    """, (code, name, price, description))
+                    await conn.commit()
+
+            if exists:
                 await ctx.send(f"❌ Product with code {code} already exists!")
                 return
-
-            # Add product
-            cursor.execute("""
-                INSERT INTO products (code, name, price, description, stock)
-                VALUES (?, ?, ?, ?, 0)
-            """, (code, name, price, description))
-
-            conn.commit()
+            self._invalidate_product(code)
 
             embed = discord.Embed(
                 title="✅ Product Added",
@@ -126,9 +123,6 @@ class AdminCog(commands.Cog, name="Admin"):
         except Exception as e:
             self.logger.error(f"Error adding product: {e}")
             await ctx.send(f"❌ Error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
 
     @commands.command(name="editproduct")
     async def edit_product(self, ctx, code: str, field: str, *, value: str):
@@ -141,9 +135,6 @@ class AdminCog(commands.Cog, name="Admin"):
         - value: New value for the field
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
             valid_fields = ['name', 'price', 'description']
             if field.lower() not in valid_fields:
                 await ctx.send(
@@ -151,18 +142,6 @@ class AdminCog(commands.Cog, name="Admin"):
                 )
                 return
 
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                "SELECT * FROM products WHERE code = ?", 
-                (code,)
-            )
-            product = cursor.fetchone()
-            if not product:
-                await ctx.send(f"❌ Product {code} not found!")
-                return
-
             if field.lower() == 'price':
                 try:
                     value = int(value)
@@ -170,11 +149,18 @@ class AdminCog(commands.Cog, name="Admin"):
                     await ctx.send("❌ Price must be a number!")
                     return
 
-            cursor.execute(
-                f"UPDATE products SET {field.lower()} = ? WHERE code = ?",
-                (value, code)
-            )
-            conn.commit()
+            async with self.bot.db_pool.writer() as conn:
+                cursor = await conn.execute(
+                    f"UPDATE products SET {field.lower()} = ? WHERE code = ?",
+                    (value, code)
+                )
+                updated = cursor.rowcount
+                await conn.commit()
+
+            if not updated:
+                await ctx.send(f"❌ Product {code} not found!")
+                return
+            self._invalidate_product(code)
 
             embed = discord.Embed(
                 title="✅ Product Updated",
@@ -191,9 +177,6 @@ class AdminCog(commands.Cog, name="Admin"):
         except Exception as e:
             self.logger.error(f"Error editing product: {e}")
             await ctx.send(f"❌ Error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
 
     @commands.command(name="bulkstock")
     async def bulk_add_stock(self, ctx):
@@ -203,9 +186,6 @@ class AdminCog(commands.Cog, name="Admin"):
         Each new line will be counted as 1 stock
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
             if not ctx.message.attachments:
                 embed = discord.Embed(
                     title="❌ Missing File",
@@ -231,90 +211,21 @@ class AdminCog(commands.Cog, name="Admin"):
                 await ctx.send(embed=embed)
                 return
 
-            # Download and read file content
-            content = await attachment.read()
-            try:
-                file_content = content.decode('utf-8').strip().split('\n')
-            except UnicodeDecodeError:
-                await ctx.send("❌ File must be in text format!")
+            transaction = self.bot.get_cog('TransactionCog')
+            if not transaction:
+                await ctx.send("❌ Transaction system is not available!")
                 return
 
-            if not file_content or not any(line.strip() for line in file_content):
-                await ctx.send("❌ File is empty!")
-                return
-
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            success_count = 0
-            failed_items = []
-            duplicate_count = 0
-
-            # Get current timestamp
-            current_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-
-            # Process each line
-            for line_number, line in enumerate(file_content, 1):
-                try:
-                    # Skip empty lines
-                    if not line.strip():
-                        continue
-
-                    # Try to insert, catch duplicates
-                    try:
-                        cursor.execute("""
-                            INSERT INTO stock (content, status, added_date, added_by, line_number)
-                            VALUES (?, 'available', ?, ?, ?)
-                        """, (line.strip(), current_time, str(ctx.author), line_number))
-                        success_count += 1
-                    except sqlite3.IntegrityError:
-                        duplicate_count += 1
-                        failed_items.append(f"Line {line_number}: Duplicate entry")
-                    except Exception as e:
-                        failed_items.append(f"Line {line_number}: {str(e)}")
-
-                except Exception as e:
-                    failed_items.append(f"Line {line_number}: {str(e)}")
-
-            conn.commit()
-
-            # Create response embed
-            embed = discord.Embed(
-                title="📦 Stock Update Results",
-                description=f"File: `{attachment.filename}`",
-                color=discord.Color.blue(),
-                timestamp=datetime.utcnow()
-            )
-            
-            embed.add_field(
-                name="Summary",
-                value=f"✅ Successfully added: {success_count}\n"
-                      f"⚠️ Duplicates found: {duplicate_count}\n"
-                      f"❌ Failed entries: {len(failed_items)}",
-                inline=False
-            )
-
-            if failed_items:
-                # Split failed items into chunks if too long
-                chunks = [failed_items[i:i + 10] for i in range(0, len(failed_items), 10)]
-                for i, chunk in enumerate(chunks):
-                    embed.add_field(
-                        name=f"Failed Items (Part {i+1})",
-                        value="\n".join(chunk),
-                        inline=False
-                    )
-
-            embed.set_footer(text=f"Processed by {ctx.author} • {current_time}")
+            # Spooling and the batched insert live in TransactionCog
+            embed = await transaction.add_stock_from_file(ctx)
             await ctx.send(embed=embed)
-            
-            self.logger.info(f"Stock update completed for {attachment.filename}: {success_count} successful, {duplicate_count} duplicates, {len(failed_items)} failed")
+            self.logger.info(f"Stock added from {attachment.filename} by {ctx.author}")
 
+        except TransactionError as e:
+            await ctx.send(f"❌ {str(e)}")
         except Exception as e:
             self.logger.error(f"Error in stock update: {e}")
             await ctx.send(f"❌ Error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
 
     @commands.command(name="deleteproduct")
     async def delete_product(self, ctx, code: str):
@@ -325,17 +236,12 @@ class AdminCog(commands.Cog, name="Admin"):
         - code: Product code to delete
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                "SELECT name FROM products WHERE code = ?", 
-                (code,)
-            )
-            product = cursor.fetchone()
+            async with self.bot.db_pool.reader() as conn:
+                cursor = await conn.execute(
+                    "SELECT name FROM products WHERE code = ?", 
+                    (code,)
+                )
+                product = await cursor.fetchone()
             if not product:
                 await ctx.send(f"❌ Product {code} not found!")
                 return
@@ -364,11 +270,14 @@ class AdminCog(commands.Cog, name="Admin"):
                 await ctx.send("❌ Operation cancelled!")
                 return
 
-            cursor.execute(
-                "DELETE FROM products WHERE code = ?", 
-                (code,)
-            )
-            conn.commit()
+            # Take the writer only after confirmation, not while waiting on it
+            async with self.bot.db_pool.writer() as conn:
+                await conn.execute(
+                    "DELETE FROM products WHERE code = ?", 
+                    (code,)
+                )
+                await conn.commit()
+            self._invalidate_product(code)
 
             embed = discord.Embed(
                 title="✅ Product Deleted",
@@ -383,9 +292,6 @@ class AdminCog(commands.Cog, name="Admin"):
         except Exception as e:
             self.logger.error(f"Error deleting product: {e}")
             await ctx.send(f"❌ Error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
 
     @commands.command(name="addbalance")
     async def add_balance(self, ctx, growid: str, amount: int, currency: str):
@@ -398,9 +304,6 @@ class AdminCog(commands.Cog, name="Admin"):
         - currency: Currency type (WL/DL/BGL)
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
             currency = currency.upper()
             if currency not in CURRENCY_RATES:
                 await ctx.send(
@@ -453,9 +356,6 @@ class AdminCog(commands.Cog, name="Admin"):
         - currency: Currency type (WL/DL/BGL)
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
             currency = currency.upper()
             if currency not in CURRENCY_RATES:
                 await ctx.send(
@@ -506,9 +406,6 @@ class AdminCog(commands.Cog, name="Admin"):
         - growid: User's Growtopia ID
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
             conn = get_connection()
             cursor = conn.cursor()
 
@@ -554,9 +451,6 @@ class AdminCog(commands.Cog, name="Admin"):
         - growid: User's Growtopia ID to reset
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
             confirm_msg = await ctx.send(
                 f"⚠️ Are you sure you want to reset {growid}'s balance?\n"
                 f"This action cannot be undone!"
@@ -581,33 +475,27 @@ class AdminCog(commands.Cog, name="Admin"):
                 await ctx.send("❌ Operation cancelled!")
                 return
 
-            conn = get_connection()
-            cursor = conn.cursor()
-
-            # Check if user exists
-            cursor.execute(
-                "SELECT growid FROM users WHERE growid = ?", 
-                (growid,)
-            )
-            if not cursor.fetchone():
+            async with self.bot.db_pool.writer() as conn:
+                # Reset balance; no row means the user does not exist
+                cursor = await conn.execute("""
+                    UPDATE users 
+                    SET balance_wl = 0, balance_dl = 0, balance_bgl = 0 
+                    WHERE growid = ?
+                """, (growid,))
+                found = cursor.rowcount > 0
+                if found:
+                    # Add transaction log
+                    await conn.execute("""
+                        INSERT INTO transaction_log (
+                            growid, type, amount, details
+                        ) VALUES (?, 'RESET', 0, ?)
+                    """, (growid, f"Balance reset by admin {ctx.author}"))
+                    await conn.commit()
+
+            if not found:
                 await ctx.send(f"❌ User {growid} not found!")
                 return
-
-            # Reset balance
-            cursor.execute("""
-                UPDATE users 
-                SET balance_wl = 0, balance_dl = 0, balance_bgl = 0 
-                WHERE growid = ?
-            """, (growid,))
-            
-            # Add transaction log
-            cursor.execute("""
-                INSERT INTO transaction_log (
-                    growid, type, amount, details
-                ) VALUES (?, 'RESET', 0, ?)
-            """, (growid, f"Balance reset by admin {ctx.author}"))
-
-            conn.commit()
+            self._invalidate_balance(growid)
 
             embed = discord.Embed(
                 title="✅ User Reset",
@@ -622,9 +510,6 @@ class AdminCog(commands.Cog, name="Admin"):
         except Exception as e:
             self.logger.error(f"Error resetting user: {e}")
             await ctx.send(f"❌ Error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
 
     @commands.command(name="transactions")
     async def view_transactions(self, ctx, growid: str, limit: int = 10):
@@ -636,14 +521,11 @@ class AdminCog(commands.Cog, name="Admin"):
         - limit: Number of transactions to show (default: 10)
         """
         try:
-            if not await self._check_admin(ctx):
-                return
-
             conn = get_connection()
             cursor = conn.cursor()
 
             cursor.execute("""
-                SELECT type, amount, details, timestamp
+                SELECT type, amount, details, timestamp, new_wl, new_dl, new_bgl
                 FROM transaction_log
                 WHERE growid = ?
                 ORDER BY timestamp DESC
@@ -660,10 +542,14 @@ class AdminCog(commands.Cog, name="Admin"):
                 color=discord.Color.blue()
             )
 
-            for tx_type, amount, details, timestamp in transactions:
+            for tx_type, amount, details, timestamp, *new_balance in transactions:
+                value = f"Amount: {amount:,} WLs\nDetails: {details}"
+                # Balances are stored raw and only formatted for display
+                if new_balance[0] is not None:
+                    value += f"\nBalance After: {Balance(*new_balance).total_wls:,} WLs"
                 embed.add_field(
                     name=f"{tx_type} - {timestamp}",
-                    value=f"Amount: {amount:,} WLs\nDetails: {details}",
+                    value=value,
                     inline=False
                 )
 
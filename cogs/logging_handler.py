@@ -10,9 +10,11 @@ class LoggingHandler(commands.Cog):
         self.bot = bot
         self.logger = logging.getLogger('discord')
         self.logger.setLevel(logging.INFO)
-        handler = logging.FileHandler(filename=LOG_FILE, encoding='utf-8', mode='w')
-        handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-        self.logger.addHandler(handler)
+        # Attach the file handler once, not again on every cog reload
+        if not any(isinstance(h, logging.FileHandler) for h in self.logger.handlers):
+            handler = logging.FileHandler(filename=LOG_FILE, encoding='utf-8', mode='w')
+            handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+            self.logger.addHandler(handler)
 
     @commands.Cog.listener()
     async def on_command_completion(self, ctx):
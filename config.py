@@ -0,0 +1,18 @@
+import json
+from functools import lru_cache
+from types import MappingProxyType
+
+# orjson is optional; discord.py also picks it up for gateway payloads
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+CONFIG_PATH = 'config.json'
+
+@lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_PATH):
+    """Parse config.json once and return a read-only view of it"""
+    with open(path, 'rb') as config_file:
+        return MappingProxyType(json_loads(config_file.read()))
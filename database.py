@@ -1,15 +1,116 @@
 import sqlite3
+import aiosqlite
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
 import os
 
 logger = logging.getLogger(__name__)
 
 DATABASE_PATH = 'shop.db'
+# Prepared statements kept per connection by the sqlite3 driver (default 128)
+STATEMENT_CACHE_SIZE = 256
+POOL_SIZE = 4  # Read-only connections; writes use a single extra connection
+
+# Raw balance snapshots kept per transaction_log row
+BALANCE_LOG_COLUMNS = ('old_wl', 'old_dl', 'old_bgl', 'new_wl', 'new_dl', 'new_bgl')
+
+# Applied to every connection when it is opened
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+)
 
 def get_connection():
     """Get SQLite database connection"""
-    return sqlite3.connect(DATABASE_PATH)
+    conn = sqlite3.connect(DATABASE_PATH, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+async def connect_async(path: str = DATABASE_PATH):
+    """Open an aiosqlite connection with the standard PRAGMAs applied"""
+    conn = await aiosqlite.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        await conn.execute(pragma)
+    await conn.commit()
+    return conn
+
+class ConnectionPool:
+    """Read-only aiosqlite connections plus a single writer connection
+
+    WAL lets readers run alongside the writer, so catalog and balance
+    reads never queue behind a purchase. Writes made through the pool share
+    one connection guarded by an asyncio lock, so they queue on the event
+    loop rather than on SQLite's busy timeout. The donation server thread
+    and setup_database still write through their own sync connections and
+    can contend for SQLite's write lock.
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._readers = []
+        self._idle = asyncio.Queue()
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+
+    async def _connect_reader(self):
+        conn = await connect_async(self.path)
+        await conn.execute("PRAGMA query_only=1")
+        # Rows support both index and key access
+        conn.row_factory = aiosqlite.Row
+        return conn
+
+    async def open(self):
+        """Open the writer and all pooled reader connections"""
+        self._writer = await connect_async(self.path)
+        for _ in range(self.size):
+            conn = await self._connect_reader()
+            self._readers.append(conn)
+            self._idle.put_nowait(conn)
+
+        cursor = await self._writer.execute("PRAGMA journal_mode")
+        journal_mode = (await cursor.fetchone())[0]
+        if journal_mode.lower() != 'wal':
+            logger.warning(f"Database is not in WAL mode (journal_mode={journal_mode})")
+        logger.info(f"Database pool opened with {self.size} readers and 1 writer")
+
+    @asynccontextmanager
+    async def reader(self):
+        """Borrow a read-only connection and return it to the pool afterwards"""
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            # Never hand an open transaction to the next borrower
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        """Hold the writer connection exclusively"""
+        async with self._write_lock:
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+
+    async def close(self):
+        """Close all pooled connections"""
+        for conn in self._readers:
+            await conn.close()
+        self._readers.clear()
+        if self._writer:
+            await self._writer.close()
+            self._writer = None
 
 def get_balance(growid: str):
     """Get user balance from database"""
@@ -81,6 +182,12 @@ def setup_database():
             )
         """)
 
+        # Partial index over the rows a purchase can still claim
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_stock_available
+            ON stock(id) WHERE status = 'available'
+        """)
+
         # Create transaction_log table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS transaction_log (
@@ -89,13 +196,24 @@ def setup_database():
                 amount INTEGER NOT NULL,
                 type TEXT NOT NULL,
                 details TEXT,
-                old_balance TEXT,
-                new_balance TEXT,
+                old_wl INTEGER,
+                old_dl INTEGER,
+                old_bgl INTEGER,
+                new_wl INTEGER,
+                new_dl INTEGER,
+                new_bgl INTEGER,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (growid) REFERENCES users(growid)
             )
         """)
 
+        # Older databases logged formatted balance strings; add the integer columns
+        cursor.execute("PRAGMA table_info(transaction_log)")
+        log_columns = {row[1] for row in cursor.fetchall()}
+        for column in BALANCE_LOG_COLUMNS:
+            if column not in log_columns:
+                cursor.execute(f"ALTER TABLE transaction_log ADD COLUMN {column} INTEGER")
+
         # Create world_info table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS world_info (
@@ -1,9 +1,8 @@
 import discord
 from discord.ext import commands
 import logging
-from database import get_connection
-from datetime import datetime
-from .constants import Balance, TransactionError, CURRENCY_RATES
+from database import format_datetime
+from .constants import Balance, TransactionError, get_total_wls
 
 class BalanceManager(commands.Cog):
     def __init__(self, bot):
@@ -14,17 +13,24 @@ class BalanceManager(commands.Cog):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
         
-    async def get_user_balance(self, growid: str) -> Balance:
-        """Get user's balance from database"""
-        conn = None
+    def _invalidate_balance(self, growid: str):
+        """Drop the live panel's cached balance embed after a committed change"""
+        live_stock = self.bot.get_cog('LiveStock')
+        if live_stock:
+            live_stock.stock_view.invalidate_balance(growid)
+
+    async def get_user_balance(self, growid: str, conn=None) -> Balance:
+        """Get user's balance from database, optionally on an open connection"""
+        if conn is None:
+            async with self.bot.db_pool.reader() as conn:
+                return await self.get_user_balance(growid, conn)
+
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+            cursor = await conn.execute(
                 "SELECT balance_wl, balance_dl, balance_bgl FROM users WHERE growid = ?",
                 (growid,)
             )
-            result = cursor.fetchone()
+            result = await cursor.fetchone()
             if result:
                 return Balance(*result)
             return Balance(0, 0, 0)
@@ -32,10 +38,6 @@ class BalanceManager(commands.Cog):
         except Exception as e:
             self.logger.error(f"Error getting balance: {e}")
             raise TransactionError(f"Failed to get balance: {str(e)}")
-            
-        finally:
-            if conn:
-                conn.close()
 
     async def update_balance(
         self, 
@@ -44,16 +46,28 @@ class BalanceManager(commands.Cog):
         dl: int = 0, 
         bgl: int = 0,
         transaction_type: str = "MANUAL",
-        details: str = ""
+        details: str = "",
+        conn=None,
+        timestamp: str = None
     ) -> Balance:
-        """Update user's balance and log transaction"""
-        conn = None
+        """Update user's balance and log transaction, optionally on an open connection"""
+        if conn is None:
+            # Own the writer for the whole read-modify-write
+            async with self.bot.db_pool.writer() as conn:
+                try:
+                    new_balance = await self.update_balance(
+                        growid, wl, dl, bgl, transaction_type, details, conn, timestamp
+                    )
+                    await conn.commit()
+                except Exception:
+                    await conn.rollback()
+                    raise
+            self._invalidate_balance(growid)
+            return new_balance
+
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            # Get current balance
-            current = await self.get_user_balance(growid)
+            # Get current balance on the same connection
+            current = await self.get_user_balance(growid, conn)
             
             # Calculate new balance
             new_balance = Balance(
@@ -67,7 +81,7 @@ class BalanceManager(commands.Cog):
                 raise TransactionError("Balance cannot be negative")
                 
             # Update balance
-            cursor.execute("""
+            await conn.execute("""
                 UPDATE users 
                 SET balance_wl = ?, 
                     balance_dl = ?, 
@@ -76,31 +90,26 @@ class BalanceManager(commands.Cog):
             """, (new_balance.wl, new_balance.dl, new_balance.bgl, growid))
             
             # Log transaction
-            cursor.execute("""
+            await conn.execute("""
                 INSERT INTO transaction_log 
-                (growid, amount, type, details, old_balance, new_balance, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+                (growid, amount, type, details,
+                 old_wl, old_dl, old_bgl, new_wl, new_dl, new_bgl, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """, (
                 growid,
-                wl + (dl * CURRENCY_RATES['DL']) + (bgl * CURRENCY_RATES['BGL']),
+                get_total_wls(wl, dl, bgl),
                 transaction_type,
                 details,
-                current.format(),
-                new_balance.format()
+                current.wl, current.dl, current.bgl,
+                new_balance.wl, new_balance.dl, new_balance.bgl,
+                timestamp or format_datetime()
             ))
             
-            conn.commit()
             return new_balance
             
         except Exception as e:
-            if conn:
-                conn.rollback()
             self.logger.error(f"Error updating balance: {e}")
             raise TransactionError(f"Failed to update balance: {str(e)}")
-            
-        finally:
-            if conn:
-                conn.close()
 
 async def setup(bot):
     await bot.add_cog(BalanceManager(bot))
\ No newline at end of file
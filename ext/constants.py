@@ -1,11 +1,13 @@
 from dataclasses import dataclass
-from decimal import Decimal
 from typing import Dict
 
 # Currency constants
+WL_PER_DL = 100
+WL_PER_BGL = 10000
+
 CURRENCY_RATES: Dict[str, int] = {
-    'BGL': 10000,
-    'DL': 100,
+    'BGL': WL_PER_BGL,
+    'DL': WL_PER_DL,
     'WL': 1
 }
 
@@ -17,6 +19,10 @@ MAX_ITEMS_PER_MESSAGE = 20
 CACHE_TTL = 300  # 5 minutes
 MAX_CACHE_SIZE = 1000
 
+def get_total_wls(wl: int, dl: int, bgl: int) -> int:
+    """Convert a WL/DL/BGL amount to WLs"""
+    return wl + dl * WL_PER_DL + bgl * WL_PER_BGL
+
 @dataclass
 class Balance:
     wl: int
@@ -25,13 +31,13 @@ class Balance:
     
     @property
     def total_wls(self) -> int:
-        return self.wl + (self.dl * CURRENCY_RATES['DL']) + (self.bgl * CURRENCY_RATES['BGL'])
+        return get_total_wls(self.wl, self.dl, self.bgl)
     
     def format(self) -> str:
         return (
             f"• {self.wl:,} WL\n"
-            f"• {self.dl:,} DL (= {self.dl * CURRENCY_RATES['DL']:,} WL)\n"
-            f"• {self.bgl:,} BGL (= {self.bgl * CURRENCY_RATES['BGL']:,} WL)\n"
+            f"• {self.dl:,} DL (= {self.dl * WL_PER_DL:,} WL)\n"
+            f"• {self.bgl:,} BGL (= {self.bgl * WL_PER_BGL:,} WL)\n"
             f"Total: {self.total_wls:,} WL"
         )
 
@@ -5,13 +5,10 @@ from datetime import datetime
 import json
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from database import get_connection
-from .constants import Balance, TransactionError, CURRENCY_RATES
+from config import load_config
+from .constants import Balance, TransactionError, get_total_wls
 
-# Load config
-with open('config.json') as config_file:
-    config = json.load(config_file)
-
-DONATION_LOG_CHANNEL_ID = int(config['id_donation_log'])
+DONATION_LOG_CHANNEL_ID = int(load_config()['id_donation_log'])
 PORT = 8081
 
 class DonateHandler(BaseHTTPRequestHandler):
@@ -113,22 +110,19 @@ class DonateHandler(BaseHTTPRequestHandler):
             """, (new_balance.wl, new_balance.dl, new_balance.bgl, growid))
             
             # Log transaction
-            total_wls = (
-                wl + 
-                (dl * CURRENCY_RATES['DL']) + 
-                (bgl * CURRENCY_RATES['BGL'])
-            )
+            total_wls = get_total_wls(wl, dl, bgl)
             
             cursor.execute("""
                 INSERT INTO transaction_log 
-                (growid, amount, type, details, old_balance, new_balance)
-                VALUES (?, ?, 'DONATION', ?, ?, ?)
+                (growid, amount, type, details,
+                 old_wl, old_dl, old_bgl, new_wl, new_dl, new_bgl)
+                VALUES (?, ?, 'DONATION', ?, ?, ?, ?, ?, ?, ?)
             """, (
                 growid,
                 total_wls,
                 f"Donation: {wl} WL, {dl} DL, {bgl} BGL",
-                current.format(),
-                new_balance.format()
+                current.wl, current.dl, current.bgl,
+                new_balance.wl, new_balance.dl, new_balance.bgl
             ))
             
             conn.commit()
@@ -174,7 +168,7 @@ class DonateHandler(BaseHTTPRequestHandler):
         bgl: int, 
         new_balance: Balance
     ):
-        channel = self.bot.get_channel(DONATION_LOG_CHANNEL_ID)
+        channel = self.bot.donation_log_channel or self.bot.get_channel(DONATION_LOG_CHANNEL_ID)
         if not channel:
             self.logger.error("Donation log channel not found")
             return
@@ -4,50 +4,51 @@ from discord.ui import Button, Modal, TextInput, View
 import logging
 from datetime import datetime
 import asyncio
-from database import get_connection
-from ext.product_manager import ProductManager
-from ext.balance_manager import BalanceManager
-from ext.trx import TransactionCog
+import time
 from ext.constants import Balance, CURRENCY_RATES, MAX_ITEMS_PER_MESSAGE
-import json
-from typing import Optional, Dict, Any
+from config import load_config
+from typing import Optional, Dict, Any, List, Tuple
 
-# Load config
-with open('config.json') as config_file:
-    config = json.load(config_file)
-
-LIVE_STOCK_CHANNEL_ID = int(config['id_live_stock'])
-COOLDOWN_SECONDS = 3
+LIVE_STOCK_CHANNEL_ID = int(load_config()['id_live_stock'])
+BUCKET_CAPACITY = 10  # Burst of button interactions allowed per user
+BUCKET_RATE = 10 / 60  # Tokens refilled per second (10 per minute)
 UPDATE_INTERVAL = 55  # Seconds between updates
+BALANCE_CACHE_TTL = 10  # Seconds a rendered balance embed is reused
+MAX_EMBED_FIELDS = 25  # Discord limit per embed
+MAX_EMBEDS_PER_MESSAGE = 10  # Discord limit per message
+MAX_MESSAGE_EMBED_CHARS = 6000  # Discord limit across all embeds of a message
+STOCK_EMBED_TITLE = "🏪 Store Stock Status"
+NO_PRODUCTS_TEXT = "No products available."
 
 def format_datetime() -> str:
     """Get current datetime in UTC"""
     return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
-class BuyModal(Modal):
+class BuyModal(Modal, title="Buy Product"):
+    # Input settings are shared; plain TextInput attributes on the class
+    # would be deep-copied by discord.py on every instantiation instead
+    PRODUCT_CODE_INPUT = dict(
+        label="Product Code",
+        placeholder="Enter product code",
+        required=True,
+        min_length=1,
+        max_length=10,
+        custom_id="product_code"
+    )
+    QUANTITY_INPUT = dict(
+        label="Quantity", 
+        placeholder="Enter quantity",
+        required=True,
+        min_length=1,
+        max_length=3,
+        custom_id="quantity"
+    )
+
     def __init__(self, bot):
-        super().__init__(title="Buy Product")
+        super().__init__()
         self.bot = bot
-        self.transaction = TransactionCog(bot)
-        
-        self.product_code = TextInput(
-            label="Product Code",
-            placeholder="Enter product code",
-            required=True,
-            min_length=1,
-            max_length=10,
-            custom_id="product_code"
-        )
-        
-        self.quantity = TextInput(
-            label="Quantity", 
-            placeholder="Enter quantity",
-            required=True,
-            min_length=1,
-            max_length=3,
-            custom_id="quantity"
-        )
-        
+        self.product_code = TextInput(**self.PRODUCT_CODE_INPUT)
+        self.quantity = TextInput(**self.QUANTITY_INPUT)
         self.add_item(self.product_code)
         self.add_item(self.quantity)
     
@@ -61,7 +62,11 @@ class BuyModal(Modal):
                 )
                 return
                 
-            result = await self.transaction.process_purchase(
+            transaction = self.bot.get_cog('TransactionCog')
+            if not transaction:
+                raise RuntimeError("Transaction system is not loaded")
+
+            result = await transaction.process_purchase(
                 interaction.user, 
                 self.product_code.value.upper(), 
                 quantity
@@ -90,20 +95,20 @@ class BuyModal(Modal):
                 ephemeral=True
             )
 
-class SetGrowIDModal(Modal):
+class SetGrowIDModal(Modal, title="Set GrowID"):
+    GROWID_INPUT = dict(
+        label="GrowID",
+        placeholder="Enter your GrowID",
+        required=True,
+        min_length=3,
+        max_length=20,
+        custom_id="growid"
+    )
+
     def __init__(self, bot):
-        super().__init__(title="Set GrowID")
+        super().__init__()
         self.bot = bot
-        
-        self.growid = TextInput(
-            label="GrowID",
-            placeholder="Enter your GrowID",
-            required=True,
-            min_length=3,
-            max_length=20,
-            custom_id="growid"
-        )
-        
+        self.growid = TextInput(**self.GROWID_INPUT)
         self.add_item(self.growid)
     
     async def on_submit(self, interaction: discord.Interaction):
@@ -117,55 +122,47 @@ class SetGrowIDModal(Modal):
                 )
                 return
             
-            conn = None
-            try:
-                conn = get_connection()
-                cursor = conn.cursor()
-                
-                # Check if GrowID already registered to another user
-                cursor.execute(
-                    "SELECT user_id FROM user_growid WHERE growid = ? AND user_id != ?",
-                    (growid, interaction.user.id)
-                )
-                if cursor.fetchone():
-                    await interaction.response.send_message(
-                        "❌ This GrowID is already registered to another user.",
-                        ephemeral=True
+            async with self.bot.db_pool.writer() as conn:
+                try:
+                    # Check if GrowID already registered to another user
+                    cursor = await conn.execute(
+                        "SELECT user_id FROM user_growid WHERE growid = ? AND user_id != ?",
+                        (growid, interaction.user.id)
                     )
-                    return
-                
-                cursor.execute(
-                    "INSERT OR REPLACE INTO user_growid (user_id, growid) VALUES (?, ?)",
-                    (interaction.user.id, growid)
-                )
-                cursor.execute(
-                    "INSERT OR IGNORE INTO users (growid) VALUES (?)",
-                    (growid,)
-                )
-                conn.commit()
-                
-                embed = discord.Embed(
-                    title="✅ GrowID Set Successfully",
-                    description=f"Your GrowID has been set to: `{growid}`",
-                    color=discord.Color.green(),
-                    timestamp=datetime.utcnow()
-                )
-                embed.set_footer(text=f"Set by: {interaction.user}")
-                
-                await interaction.response.send_message(
-                    embed=embed, 
-                    ephemeral=True
-                )
-                logging.info(f"GrowID set for {interaction.user}: {growid}")
-                
-            except Exception as e:
-                if conn:
-                    conn.rollback()
-                raise e
+                    if await cursor.fetchone():
+                        await interaction.response.send_message(
+                            "❌ This GrowID is already registered to another user.",
+                            ephemeral=True
+                        )
+                        return
+                    
+                    await conn.execute(
+                        "INSERT OR REPLACE INTO user_growid (user_id, growid) VALUES (?, ?)",
+                        (interaction.user.id, growid)
+                    )
+                    await conn.execute(
+                        "INSERT OR IGNORE INTO users (growid) VALUES (?)",
+                        (growid,)
+                    )
+                    await conn.commit()
+                    
+                except Exception as e:
+                    await conn.rollback()
+                    raise e
+
+            embed = discord.Embed(
+                title="✅ GrowID Set Successfully",
+                description=f"Your GrowID has been set to: `{growid}`",
+                color=discord.Color.green(),
+                timestamp=datetime.utcnow()
+            )
+            embed.set_footer(text=f"Set by: {interaction.user}")
             
-            finally:
-                if conn:
-                    conn.close()
+            await interaction.response.send_message(
+                embed=embed, 
+                ephemeral=True
+            )
+            logging.info(f"GrowID set for {interaction.user}: {growid}")
             
         except Exception as e:
             logging.error(f'Error in SetGrowIDModal: {e}')
@@ -182,15 +179,19 @@ class StockView(PersistentView):
     def __init__(self, bot):
         super().__init__()
         self.bot = bot
-        self._last_use: Dict[int, float] = {}
+        self._buckets: Dict[int, Tuple[float, float]] = {}  # user_id -> (tokens, last_update)
         self._cache_timeout = 300  # 5 minutes cache timeout
         self._cache: Dict[str, Any] = {}
-        self.balance_manager = BalanceManager(bot)
-        self.transaction = TransactionCog(bot)
+        self._balance_embed_cache: Dict[str, Tuple[discord.Embed, float]] = {}
         
         # Initialize buttons
         self._init_buttons()
 
+    @property
+    def balance_manager(self):
+        """The registered BalanceManager cog"""
+        return self.bot.get_cog('BalanceManager')
+
     def _init_buttons(self):
         """Initialize all buttons with their properties"""
         buttons_config = [
@@ -242,18 +243,23 @@ class StockView(PersistentView):
             self.add_item(button)
 
     async def check_cooldown(self, interaction: discord.Interaction) -> bool:
-        """Check if user is on cooldown"""
-        current_time = datetime.utcnow().timestamp()
-        last_use = self._last_use.get(interaction.user.id, 0)
+        """Rate limit the user with a token bucket"""
+        now = time.monotonic()
+        tokens, last_update = self._buckets.get(
+            interaction.user.id, (BUCKET_CAPACITY, now)
+        )
+        tokens = min(BUCKET_CAPACITY, tokens + (now - last_update) * BUCKET_RATE)
         
-        if current_time - last_use < COOLDOWN_SECONDS:
+        if tokens < 1:
+            self._buckets[interaction.user.id] = (tokens, now)
+            wait_time = (1 - tokens) / BUCKET_RATE
             await interaction.response.send_message(
-                "⚠️ Please wait a few seconds before using buttons again.", 
+                f"⚠️ Too many requests. Please wait {wait_time:.1f} seconds before using buttons again.", 
                 ephemeral=True
             )
             return False
         
-        self._last_use[interaction.user.id] = current_time
+        self._buckets[interaction.user.id] = (tokens - 1, now)
         return True
 
     async def get_user_growid(self, user_id: int) -> Optional[str]:
@@ -267,26 +273,33 @@ class StockView(PersistentView):
                 return growid
         
         # Get from database
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
+        async with self.bot.db_pool.reader() as conn:
+            cursor = await conn.execute(
                 "SELECT growid FROM user_growid WHERE user_id = ?", 
                 (user_id,)
             )
-            result = cursor.fetchone()
-            
-            if result:
-                growid = result[0]
-                # Update cache
-                self._cache[cache_key] = (datetime.utcnow().timestamp(), growid)
-                return growid
-            return None
+            result = await cursor.fetchone()
             
-        finally:
-            if conn:
-                conn.close()
+        if result:
+            growid = result[0]
+            # Update cache
+            self._cache[cache_key] = (datetime.utcnow().timestamp(), growid)
+            return growid
+        return None
+
+    def _store_balance_embed(self, growid: str, embed: discord.Embed):
+        """Cache a rendered balance embed, dropping expired entries"""
+        now = time.monotonic()
+        self._balance_embed_cache = {
+            key: cached
+            for key, cached in self._balance_embed_cache.items()
+            if now - cached[1] < BALANCE_CACHE_TTL
+        }
+        self._balance_embed_cache[growid] = (embed, now)
+
+    def invalidate_balance(self, growid: str):
+        """Drop the cached balance embed for a GrowID"""
+        self._balance_embed_cache.pop(growid, None)
 
     async def button_balance_callback(self, interaction: discord.Interaction):
         if not await self.check_cooldown(interaction):
@@ -296,6 +309,18 @@ class StockView(PersistentView):
             growid = await self.get_user_growid(interaction.user.id)
             
             if growid:
+                # Reuse a recently rendered embed for repeated clicks
+                cached = self._balance_embed_cache.get(growid)
+                if cached and time.monotonic() - cached[1] < BALANCE_CACHE_TTL:
+                    embed = cached[0]
+                    embed.timestamp = datetime.utcnow()
+                    embed.set_footer(text=f"Checked by: {interaction.user}")
+                    await interaction.response.send_message(
+                        embed=embed, 
+                        ephemeral=True
+                    )
+                    return
+
                 balance = await self.balance_manager.get_user_balance(growid)
                 if balance:
                     embed = discord.Embed(
@@ -310,6 +335,7 @@ class StockView(PersistentView):
                         inline=False
                     )
                     embed.set_footer(text=f"Checked by: {interaction.user}")
+                    self._store_balance_embed(growid, embed)
                     
                     await interaction.response.send_message(
                         embed=embed, 
@@ -425,13 +451,11 @@ class StockView(PersistentView):
                     )
                     return
             
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT world, owner, bot FROM world_info WHERE id = 1"
-            )
-            world_info = cursor.fetchone()
-            conn.close()
+            async with self.bot.db_pool.reader() as conn:
+                cursor = await conn.execute(
+                    "SELECT world, owner, bot FROM world_info WHERE id = 1"
+                )
+                world_info = await cursor.fetchone()
             
             if world_info:
                 # Update cache
@@ -471,19 +495,18 @@ class StockView(PersistentView):
 class LiveStock(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.message_id = None
+        self._message: Optional[discord.Message] = None
         self.update_lock = asyncio.Lock()
-        self.last_update = 0
+        self.last_update = float("-inf")
         self.stock_view = StockView(bot)
-        self.product_manager = ProductManager(bot)
-        self.balance_manager = BalanceManager(bot)
-        self.transaction = TransactionCog(bot)
         self._cache = {}
         self._cache_timeout = 300  # 5 minutes
         self.live_stock.start()
 
-    def db_connect(self):
-        return get_connection()
+    @property
+    def product_manager(self):
+        """The ProductManager owned by the registered ProductManagerCog"""
+        return self.bot.get_cog('ProductManagerCog').product_manager
 
     def cog_unload(self):
         self.live_stock.cancel()
@@ -494,17 +517,8 @@ class LiveStock(commands.Cog):
         logging.info("LiveStock cog is ready")
 
     async def _get_cached_products(self):
-        """Get products from cache or database"""
-        current_time = datetime.utcnow().timestamp()
-        
-        if 'products' in self._cache:
-            cache_time, products = self._cache['products']
-            if current_time - cache_time < self._cache_timeout:
-                return products
-                
-        products = await self.product_manager.get_all_products()
-        self._cache['products'] = (current_time, products)
-        return products
+        """Get products through ProductManager's cache, which writes invalidate"""
+        return await self.product_manager.get_all_products()
 
     async def _get_cached_world_info(self):
         """Get world info from cache or database"""
@@ -515,116 +529,134 @@ class LiveStock(commands.Cog):
             if current_time - cache_time < self._cache_timeout:
                 return world_info
                 
-        conn = self.db_connect()
-        cursor = conn.cursor()
-        cursor.execute("SELECT world, owner, bot FROM world_info WHERE id = 1")
-        world_info = cursor.fetchone()
-        conn.close()
+        async with self.bot.db_pool.reader() as conn:
+            cursor = await conn.execute("SELECT world, owner, bot FROM world_info WHERE id = 1")
+            world_info = await cursor.fetchone()
         
         if world_info:
             self._cache['world_info'] = (current_time, world_info)
         return world_info
 
-    def _create_stock_embed(self, products, world_info) -> discord.Embed:
-        """Create embed for stock display"""
-        embed = discord.Embed(
-            title="🏪 Store Stock Status",
-            color=discord.Color.blue(),
-            timestamp=datetime.utcnow()
-        )
-
+    def _create_stock_embeds(self, products, world_info) -> List[discord.Embed]:
+        """Create embeds for stock display, split to respect the field limit"""
+        fields = []
         if world_info:
             world, owner, bot_name = world_info
-            embed.add_field(
-                name="🌍 World Information",
-                value=(
-                    f"World: `{world}`\n"
-                    f"Owner: `{owner}`\n"
-                    f"Bot: `{bot_name}`"
-                ),
-                inline=False
+            fields.append((
+                "🌍 World Information",
+                f"World: `{world}`\n"
+                f"Owner: `{owner}`\n"
+                f"Bot: `{bot_name}`",
+                False
+            ))
+
+        fields.extend(
+            (
+                f"🔸 {product['name']} 🔸",
+                f"💎 Code: `{product['code']}`\n"
+                f"📦 Stock: `{product['stock']}`\n"
+                f"💰 Price: `{product['price']:,} WL`\n"
+                + (f"📝 Info: {product['description']}\n" if product.get('description') else ""),
+                False
             )
+            for product in products or ()
+        )
 
-        if products:
-            for product in products:
-                code = product['code']
-                name = product['name']
-                price = product['price']
-                stock = product['stock']
-                description = product.get('description', '')
-                
-                # Format product field
-                value = (
-                    f"💎 Code: `{code}`\n"
-                    f"📦 Stock: `{stock}`\n"
-                    f"💰 Price: `{price:,} WL`\n"
-                )
-                if description:
-                    value += f"📝 Info: {description}\n"
-                
-                embed.add_field(
-                    name=f"🔸 {name} 🔸",
-                    value=value,
-                    inline=False
-                )
-        else:
-            embed.description = "No products available."
+        footer = f"Last Update: {format_datetime()} UTC"
 
-        embed.set_footer(text=f"Last Update: {format_datetime()} UTC")
-        return embed
+        # Fill pages until either the embed count or the per-message character
+        # limit would be exceeded; Discord rejects the whole edit otherwise
+        budget = (
+            MAX_MESSAGE_EMBED_CHARS
+            - len(STOCK_EMBED_TITLE) - len(NO_PRODUCTS_TEXT) - len(footer)
+        )
+        pages = [[]]
+        shown = 0
+        for name, value, inline in fields:
+            size = len(name) + len(value)
+            if size > budget:
+                break
+            if len(pages[-1]) >= MAX_EMBED_FIELDS:
+                if len(pages) >= MAX_EMBEDS_PER_MESSAGE:
+                    break
+                pages.append([])
+            pages[-1].append((name, value, inline))
+            budget -= size
+            shown += 1
+
+        if shown < len(fields):
+            logging.warning(
+                f"Stock display dropped {len(fields) - shown} of {len(fields)} "
+                f"fields to fit Discord's message limits"
+            )
+
+        embeds = []
+        for page in pages:
+            embed = discord.Embed(
+                title=STOCK_EMBED_TITLE if not embeds else None,
+                color=discord.Color.blue(),
+                timestamp=datetime.utcnow()
+            )
+            for name, value, inline in page:
+                embed.add_field(name=name, value=value, inline=inline)
+            embeds.append(embed)
+
+        if not products:
+            embeds[0].description = NO_PRODUCTS_TEXT
+
+        embeds[-1].set_footer(text=footer)
+        return embeds
 
     @tasks.loop(minutes=1)
     async def live_stock(self):
-        if not self.update_lock.locked():
-            async with self.update_lock:
+        # Check the interval before taking the lock so a "too soon" tick is free
+        now = time.monotonic()
+        if now - self.last_update < UPDATE_INTERVAL:
+            return
+        self.last_update = now
+
+        # The task loop already serializes ticks; the lock only guards against
+        # overlap with a manually triggered refresh
+        async with self.update_lock:
+            try:
+                channel = self.bot.live_stock_channel or self.bot.get_channel(LIVE_STOCK_CHANNEL_ID)
+                if not channel:
+                    logging.error('Live stock channel not found')
+                    return
+
                 try:
-                    current_time = datetime.utcnow().timestamp()
-                    if current_time - self.last_update < UPDATE_INTERVAL:
-                        return
-                    self.last_update = current_time
+                    # Get cached data
+                    products = await self._get_cached_products()
+                    world_info = await self._get_cached_world_info()
                     
-                    channel = self.bot.get_channel(LIVE_STOCK_CHANNEL_ID)
-                    if not channel:
-                        logging.error('Live stock channel not found')
-                        return
-
-                    try:
-                        # Get cached data
-                        products = await self._get_cached_products()
-                        world_info = await self._get_cached_world_info()
-                        
-                        # Create embed
-                        embed = self._create_stock_embed(products, world_info)
-
-                        # Update or send message
-                        if self.message_id:
-                            try:
-                                message = await channel.fetch_message(self.message_id)
-                                await message.edit(embed=embed, view=self.stock_view)
-                                logging.info(f"Stock message updated at {format_datetime()}")
-                            except discord.NotFound:
-                                message = await channel.send(embed=embed, view=self.stock_view)
-                                self.message_id = message.id
-                                logging.info(f"New stock message created at {format_datetime()}")
-                        else:
-                            message = await channel.send(embed=embed, view=self.stock_view)
-                            self.message_id = message.id
-                            logging.info(f"Initial stock message created at {format_datetime()}")
-
-                    except Exception as e:
-                        logging.error(f"Error updating stock message: {e}")
-                        if self.message_id:
-                            try:
-                                message = await channel.fetch_message(self.message_id)
-                                await message.edit(
-                                    content="❌ Error updating stock information. Please try again later."
-                                )
-                            except:
-                                pass
-                        self.message_id = None
+                    # Create embeds
+                    embeds = self._create_stock_embeds(products, world_info)
+
+                    # Update or send message
+                    if self._message:
+                        try:
+                            await self._message.edit(embeds=embeds)
+                            logging.info(f"Stock message updated at {format_datetime()}")
+                        except discord.NotFound:
+                            self._message = await channel.send(embeds=embeds, view=self.stock_view)
+                            logging.info(f"New stock message created at {format_datetime()}")
+                    else:
+                        self._message = await channel.send(embeds=embeds, view=self.stock_view)
+                        logging.info(f"Initial stock message created at {format_datetime()}")
 
                 except Exception as e:
-                    logging.error(f"Error in live_stock task: {e}")
+                    logging.error(f"Error updating stock message: {e}")
+                    if self._message:
+                        try:
+                            await self._message.edit(
+                                content="❌ Error updating stock information. Please try again later."
+                            )
+                        except:
+                            pass
+                    self._message = None
+
+            except Exception as e:
+                logging.error(f"Error in live_stock task: {e}")
 
     @live_stock.before_loop
     async def before_live_stock(self):
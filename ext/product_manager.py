@@ -1,111 +1,112 @@
 import discord
 from discord.ext import commands
 import logging
-from database import get_connection
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import sqlite3
+import time
+from itertools import combinations
+
+PRODUCT_CACHE_TTL = 30  # Seconds product reads are served from memory
+PRODUCT_CACHE_SIZE = 512
+
+UPDATABLE_FIELDS = ('name', 'price', 'description')
+
+# One UPDATE statement per combination of fields, built once at import
+UPDATE_PRODUCT_SQL = {
+    frozenset(fields): (
+        f"UPDATE products SET {', '.join(f'{field} = ?' for field in fields)} "
+        f"WHERE code = ?"
+    )
+    for size in range(1, len(UPDATABLE_FIELDS) + 1)
+    for fields in combinations(UPDATABLE_FIELDS, size)
+}
 
 class ProductManager:
     def __init__(self, bot):
         self.bot = bot
         self._init_logger()
+        # Cached rows are for display only; purchases re-read stock in their transaction
+        self._product_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._all_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
         
     def _init_logger(self):
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
 
+    def invalidate(self, code: str):
+        """Drop cached reads affected by a write to a product"""
+        self._product_cache.pop(code, None)
+        self._all_cache = None
+
     async def get_all_products(self) -> List[Dict[str, Any]]:
-        """Get all products from database"""
-        conn = None
+        """Get all products from cache or database"""
+        if self._all_cache and time.monotonic() - self._all_cache[0] < PRODUCT_CACHE_TTL:
+            return self._all_cache[1]
+
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT code, name, price, stock, description
-                FROM products
-                ORDER BY price ASC
-            """)
-            
-            products = []
-            for row in cursor.fetchall():
-                products.append({
-                    'code': row[0],
-                    'name': row[1],
-                    'price': row[2],
-                    'stock': row[3],
-                    'description': row[4]
-                })
-            
+            async with self.bot.db_pool.reader() as conn:
+                cursor = await conn.execute("""
+                    SELECT code, name, price, stock, description
+                    FROM products
+                    ORDER BY price ASC
+                """)
+                products = [dict(row) async for row in cursor]
+            
+            self._all_cache = (time.monotonic(), products)
             return products
             
         except Exception as e:
             self.logger.error(f"Error getting products: {e}")
             raise
-            
-        finally:
-            if conn:
-                conn.close()
 
     async def get_product(self, code: str) -> Dict[str, Any]:
-        """Get a specific product by code"""
-        conn = None
+        """Get a specific product by code from cache or database"""
+        cached = self._product_cache.get(code)
+        if cached and time.monotonic() - cached[0] < PRODUCT_CACHE_TTL:
+            return cached[1]
+
         try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT code, name, price, stock, description
-                FROM products
-                WHERE code = ?
-            """, (code,))
+            async with self.bot.db_pool.reader() as conn:
+                cursor = await conn.execute("""
+                    SELECT code, name, price, stock, description
+                    FROM products
+                    WHERE code = ?
+                """, (code,))
+                row = await cursor.fetchone()
             
-            row = cursor.fetchone()
             if row:
-                return {
-                    'code': row[0],
-                    'name': row[1],
-                    'price': row[2],
-                    'stock': row[3],
-                    'description': row[4]
-                }
+                product = dict(row)
+                if len(self._product_cache) >= PRODUCT_CACHE_SIZE:
+                    # Evict the oldest entry
+                    self._product_cache.pop(next(iter(self._product_cache)))
+                self._product_cache[code] = (time.monotonic(), product)
+                return product
             return None
             
         except Exception as e:
             self.logger.error(f"Error getting product {code}: {e}")
             raise
-            
-        finally:
-            if conn:
-                conn.close()
 
     async def update_stock(self, code: str, quantity: int) -> bool:
         """Update product stock"""
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE products 
-                SET stock = stock + ? 
-                WHERE code = ?
-            """, (quantity, code))
-            
-            conn.commit()
-            self.logger.info(f"Stock updated for {code}")
-            return True
-            
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            self.logger.error(f"Error updating stock for {code}: {e}")
-            raise
-            
-        finally:
-            if conn:
-                conn.close()
+        async with self.bot.db_pool.writer() as conn:
+            try:
+                await conn.execute("""
+                    UPDATE products 
+                    SET stock = stock + ? 
+                    WHERE code = ?
+                """, (quantity, code))
+                
+                await conn.commit()
+                self.invalidate(code)
+                self.logger.info(f"Stock updated for {code}")
+                return True
+                
+            except Exception as e:
+                await conn.rollback()
+                self.logger.error(f"Error updating stock for {code}: {e}")
+                raise
 
     async def create_product(
         self, 
@@ -115,30 +116,23 @@ class ProductManager:
         description: str = ""
     ) -> bool:
         """Create a new product"""
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                INSERT INTO products (
-                    code, name, price, description, stock
-                ) VALUES (?, ?, ?, ?, 0)
-            """, (code, name, price, description))
-            
-            conn.commit()
-            self.logger.info(f"Product {code} created")
-            return True
-            
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            self.logger.error(f"Error creating product {code}: {e}")
-            raise
-            
-        finally:
-            if conn:
-                conn.close()
+        async with self.bot.db_pool.writer() as conn:
+            try:
+                await conn.execute("""
+                    INSERT INTO products (
+                        code, name, price, description, stock
+                    ) VALUES (?, ?, ?, ?, 0)
+                """, (code, name, price, description))
+                
+                await conn.commit()
+                self.invalidate(code)
+                self.logger.info(f"Product {code} created")
+                return True
+                
+            except Exception as e:
+                await conn.rollback()
+                self.logger.error(f"Error creating product {code}: {e}")
+                raise
 
     async def update_product(
         self, 
@@ -146,65 +140,47 @@ class ProductManager:
         **kwargs
     ) -> bool:
         """Update product details"""
-        valid_fields = ['name', 'price', 'description']
-        update_fields = []
-        values = []
-        
-        for field, value in kwargs.items():
-            if field in valid_fields:
-                update_fields.append(f"{field} = ?")
-                values.append(value)
+        # Canonical field order matches the precomputed statements
+        update_fields = [field for field in UPDATABLE_FIELDS if field in kwargs]
                 
         if not update_fields:
             return False
             
+        query = UPDATE_PRODUCT_SQL[frozenset(update_fields)]
+        values = [kwargs[field] for field in update_fields]
         values.append(code)
-        query = f"UPDATE products SET {', '.join(update_fields)} WHERE code = ?"
         
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            cursor.execute(query, values)
-            conn.commit()
-            self.logger.info(f"Product {code} updated")
-            return True
-            
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            self.logger.error(f"Error updating product {code}: {e}")
-            raise
-            
-        finally:
-            if conn:
-                conn.close()
+        async with self.bot.db_pool.writer() as conn:
+            try:
+                await conn.execute(query, values)
+                await conn.commit()
+                self.invalidate(code)
+                self.logger.info(f"Product {code} updated")
+                return True
+                
+            except Exception as e:
+                await conn.rollback()
+                self.logger.error(f"Error updating product {code}: {e}")
+                raise
 
     async def delete_product(self, code: str) -> bool:
         """Delete a product"""
-        conn = None
-        try:
-            conn = get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                "DELETE FROM products WHERE code = ?", 
-                (code,)
-            )
-            
-            conn.commit()
-            self.logger.info(f"Product {code} deleted")
-            return True
-            
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            self.logger.error(f"Error deleting product {code}: {e}")
-            raise
-            
-        finally:
-            if conn:
-                conn.close()
+        async with self.bot.db_pool.writer() as conn:
+            try:
+                await conn.execute(
+                    "DELETE FROM products WHERE code = ?", 
+                    (code,)
+                )
+                
+                await conn.commit()
+                self.invalidate(code)
+                self.logger.info(f"Product {code} deleted")
+                return True
+                
+            except Exception as e:
+                await conn.rollback()
+                self.logger.error(f"Error deleting product {code}: {e}")
+                raise
 
 class ProductManagerCog(commands.Cog):
     def __init__(self, bot):
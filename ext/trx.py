@@ -4,70 +4,131 @@ import logging
 from datetime import datetime
 import aiofiles
 import os
-from typing import List, Tuple, Optional
-from decimal import Decimal
+import tempfile
+from typing import List, Tuple
 import sqlite3
+from contextlib import asynccontextmanager
 
-from database import get_connection
+from database import format_datetime
 from .constants import (
     Balance, 
     TransactionError, 
-    CURRENCY_RATES,
+    WL_PER_DL,
+    WL_PER_BGL,
     MAX_ITEMS_PER_TRANSACTION,
     MAX_ITEMS_PER_MESSAGE
 )
 
+# Stock lines inserted per executemany call
+STOCK_BATCH_SIZE = 1000
+# Bytes read per chunk when downloading a stock attachment
+DOWNLOAD_CHUNK_SIZE = 65536
+
+# GrowID, product and balance for a purchase in one statement; the LEFT
+# JOINs leave NULLs so each missing piece gets its own error
+SQL_GET_PURCHASE_CONTEXT = """
+    SELECT ug.growid,
+           p.code, p.name, p.price, p.stock,
+           u.growid, u.balance_wl, u.balance_dl, u.balance_bgl
+    FROM user_growid ug
+    LEFT JOIN products p ON p.code = ?
+    LEFT JOIN users u ON u.growid = ug.growid
+    WHERE ug.user_id = ?
+"""
+
+# Claim stock items and read their content in one statement
+SQL_CLAIM_STOCK = """
+    UPDATE stock 
+    SET status = 'used',
+        used_date = datetime('now'),
+        used_by = ?,
+        buyer_growid = ?
+    WHERE id IN (
+        SELECT id 
+        FROM stock 
+        WHERE status = 'available'
+        ORDER BY id
+        LIMIT ?
+    )
+    RETURNING id, content
+"""
+
+# Only decrements when enough stock is left; check rowcount
+SQL_UPDATE_PRODUCT_STOCK = """
+    UPDATE products 
+    SET stock = stock - ? 
+    WHERE code = ? AND stock >= ?
+"""
+
+SQL_UPDATE_USER_BALANCE = """
+    UPDATE users 
+    SET balance_wl = ?, balance_dl = ?, balance_bgl = ?
+    WHERE growid = ?
+"""
+
+SQL_INSERT_PURCHASE_LOG = """
+    INSERT INTO transaction_log 
+    (growid, amount, type, details,
+     old_wl, old_dl, old_bgl, new_wl, new_dl, new_bgl, timestamp)
+    VALUES (?, ?, 'PURCHASE', ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SQL_GET_BALANCE = "SELECT balance_wl, balance_dl, balance_bgl FROM users WHERE growid = ?"
+
+SQL_INSERT_REFUND_LOG = """
+    INSERT INTO transaction_log 
+    (growid, amount, type, details,
+     old_wl, old_dl, old_bgl, new_wl, new_dl, new_bgl, timestamp)
+    VALUES (?, ?, 'REFUND', ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Put claimed stock back on sale after an undeliverable purchase
+SQL_RELEASE_STOCK = """
+    UPDATE stock 
+    SET status = 'available',
+        used_date = NULL,
+        used_by = NULL,
+        buyer_growid = NULL
+    WHERE id = ?
+"""
+
+SQL_RESTORE_PRODUCT_STOCK = """
+    UPDATE products 
+    SET stock = stock + ? 
+    WHERE code = ?
+"""
+
+SQL_INSERT_STOCK = """
+    INSERT INTO stock (
+        content, status, added_date, added_by, source_file
+    ) VALUES (?, 'available', datetime('now'), ?, ?)
+"""
+
 class TransactionCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self._init_logger()
-        self._cache = {}
-        print(f"Current Date and Time (UTC - YYYY-MM-DD HH:MM:SS formatted): {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}")
         
     def _init_logger(self):
+        # Output goes through the root handler configured in main.py
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-        )
-        handler = logging.StreamHandler()
-        handler.setFormatter(formatter)
-        self.logger.addHandler(handler)
-
-    async def _get_cached_balance(self, growid: str) -> Optional[Balance]:
-        if growid in self._cache:
-            return self._cache[growid]
-        balance = await self._get_balance_from_db(growid)
-        if balance:
-            self._cache[growid] = balance
-        return balance
-
-    async def _get_balance_from_db(self, growid: str) -> Optional[Balance]:
-        async with self._db_transaction() as cursor:
-            cursor.execute(
-                "SELECT balance_wl, balance_dl, balance_bgl FROM users WHERE growid = ?", 
-                (growid,)
-            )
-            result = cursor.fetchone()
-            return Balance(*result) if result else None
-
-    async def _update_cached_balance(self, growid: str, balance: Balance):
-        self._cache[growid] = balance
 
+    @asynccontextmanager
     async def _db_transaction(self):
-        conn = None
-        try:
-            conn = get_connection()
-            yield conn.cursor()
-            conn.commit()
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            self.logger.error(f"Database error: {e}")
-            raise TransactionError(f"Database error: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
+        async with self.bot.db_pool.writer() as conn:
+            try:
+                cursor = await conn.cursor()
+                yield cursor
+                await conn.commit()
+            except TransactionError:
+                # Business-rule failures reach the caller unwrapped
+                await conn.rollback()
+                raise
+            except Exception as e:
+                await conn.rollback()
+                self.logger.error(f"Database error: {e}")
+                raise TransactionError(f"Database error: {str(e)}")
 
     async def process_purchase(
         self, 
@@ -84,41 +145,36 @@ class TransactionCog(commands.Cog):
                     f"Maximum {MAX_ITEMS_PER_TRANSACTION} items per transaction"
                 )
 
+            # One timestamp for every row and message of this purchase
+            current_time = format_datetime()
+
             async with self._db_transaction() as cursor:
-                # Get user's GrowID
-                cursor.execute(
-                    "SELECT growid FROM user_growid WHERE user_id = ?", 
-                    (user.id,)
-                )
-                user_data = cursor.fetchone()
-                if not user_data:
+                # Take the write lock up front so the whole purchase is atomic
+                await cursor.execute("BEGIN IMMEDIATE")
+
+                # Get GrowID, product and balance together
+                await cursor.execute(SQL_GET_PURCHASE_CONTEXT, (product_code, user.id))
+                row = await cursor.fetchone()
+                if not row:
                     raise TransactionError("Please set your GrowID first!")
                 
-                growid = user_data[0]
-                
-                # Get product with lock
-                cursor.execute("""
-                    SELECT name, price, stock, description 
-                    FROM products 
-                    WHERE code = ?
-                    FOR UPDATE
-                """, (product_code,))
-                product = cursor.fetchone()
+                growid, found_code, name, price, stock, account, *balance = row
                 
-                if not product:
+                if found_code is None:
                     raise TransactionError(f"Product {product_code} not found")
-                    
-                name, price, stock, description = product
                 
-                if stock < quantity:
+                # Reserve the stock count atomically
+                await cursor.execute(
+                    SQL_UPDATE_PRODUCT_STOCK, (quantity, product_code, quantity)
+                )
+                if cursor.rowcount != 1:
                     raise TransactionError(f"Insufficient stock ({stock} available)")
                 
-                required_wls = Decimal(price) * quantity
+                required_wls = int(price) * quantity
                 
-                # Get and verify balance
-                balance = await self._get_cached_balance(growid)
-                if not balance:
+                if account is None:
                     raise TransactionError("Account not found")
+                balance = Balance(*balance)
                     
                 if balance.total_wls < required_wls:
                     raise TransactionError(
@@ -127,59 +183,50 @@ class TransactionCog(commands.Cog):
                         f"Your balance:\n{balance.format()}"
                     )
 
-                # Get items with lock
-                cursor.execute("""
-                    SELECT id, content 
-                    FROM stock 
-                    WHERE status = 'available'
-                    LIMIT ?
-                    FOR UPDATE
-                """, (quantity,))
-                
-                items = cursor.fetchall()
-                if len(items) < quantity:
-                    raise TransactionError("Stock changed during transaction")
-                
                 # Process payment
                 new_balance = await self._process_payment(
-                    cursor, growid, balance, required_wls, name, product_code
+                    cursor, growid, balance, required_wls, name, product_code,
+                    current_time
                 )
                 
-                # Update stock status
-                current_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                for item_id, _ in items:
-                    cursor.execute("""
-                        UPDATE stock 
-                        SET status = 'used',
-                            used_date = ?,
-                            used_by = ?,
-                            buyer_growid = ?
-                        WHERE id = ?
-                    """, (current_time, str(user.id), growid, item_id))
-                
-                # Update product stock count
-                cursor.execute("""
-                    UPDATE products 
-                    SET stock = stock - ? 
-                    WHERE code = ?
-                """, (quantity, product_code))
+                # Claim stock items and read their content in one statement
+                await cursor.execute(
+                    SQL_CLAIM_STOCK,
+                    (str(user.id), growid, quantity)
+                )
                 
-                # Send items to user
+                # RETURNING does not guarantee row order
+                items = sorted(await cursor.fetchall())
+                if len(items) < quantity:
+                    raise TransactionError("Stock changed during transaction")
+
+            # Only invalidate once committed, or a concurrent read could
+            # re-cache the pre-purchase balance
+            self._invalidate_caches(growid, product_code)
+
+            # Deliver after commit so DM round trips never hold the writer
+            try:
                 await self._send_items_to_user(
-                    user, name, quantity, required_wls, new_balance, items
+                    user, name, quantity, required_wls, new_balance, items,
+                    current_time
                 )
-                
-                # Update cache
-                await self._update_cached_balance(growid, new_balance)
-                
-                return (
-                    f"✅ Purchase Successful!\n"
-                    f"• Product: {name}\n"
-                    f"• Quantity: {quantity}\n" 
-                    f"• Price Paid: {required_wls:,} WLs\n"
-                    f"• New Balance:\n{new_balance.format()}\n"
-                    f"Check your DMs for the items!"
+            except TransactionError:
+                # Nothing reached the buyer; undo the purchase
+                await self._refund_purchase(
+                    growid, product_code, name, required_wls,
+                    [item_id for item_id, _ in items]
                 )
+                self._invalidate_caches(growid, product_code)
+                raise
+            
+            return (
+                f"✅ Purchase Successful!\n"
+                f"• Product: {name}\n"
+                f"• Quantity: {quantity}\n" 
+                f"• Price Paid: {required_wls:,} WLs\n"
+                f"• New Balance:\n{new_balance.format()}\n"
+                f"Check your DMs for the items!"
+            )
                 
         except TransactionError as e:
             self.logger.warning(f"Transaction failed: {e}")
@@ -189,58 +236,95 @@ class TransactionCog(commands.Cog):
             self.logger.error(f"Unexpected error: {e}")
             return "❌ An unexpected error occurred"
 
+    def _invalidate_caches(self, growid: str, product_code: str):
+        """Drop cached balance and product reads after a committed change"""
+        live_stock = self.bot.get_cog('LiveStock')
+        if live_stock:
+            live_stock.stock_view.invalidate_balance(growid)
+        product_manager = self.bot.get_cog('ProductManagerCog')
+        if product_manager:
+            product_manager.product_manager.invalidate(product_code)
+
+    async def _refund_purchase(
+        self,
+        growid: str,
+        product_code: str,
+        product_name: str,
+        amount: int,
+        item_ids: List[int]
+    ):
+        """Compensate a committed purchase whose items could not be delivered"""
+        try:
+            async with self._db_transaction() as cursor:
+                await cursor.execute("BEGIN IMMEDIATE")
+
+                # Refund against the current balance, which may have moved
+                await cursor.execute(SQL_GET_BALANCE, (growid,))
+                balance = Balance(*await cursor.fetchone())
+                bgl, remaining = divmod(balance.total_wls + amount, WL_PER_BGL)
+                dl, wl = divmod(remaining, WL_PER_DL)
+                new_balance = Balance(wl, dl, bgl)
+
+                await cursor.execute(
+                    SQL_UPDATE_USER_BALANCE,
+                    (new_balance.wl, new_balance.dl, new_balance.bgl, growid)
+                )
+                await cursor.execute(SQL_INSERT_REFUND_LOG, (
+                    growid,
+                    amount,
+                    f"Undelivered {product_name} ({product_code})",
+                    balance.wl, balance.dl, balance.bgl,
+                    new_balance.wl, new_balance.dl, new_balance.bgl,
+                    format_datetime()
+                ))
+                await cursor.executemany(
+                    SQL_RELEASE_STOCK, [(item_id,) for item_id in item_ids]
+                )
+                await cursor.execute(
+                    SQL_RESTORE_PRODUCT_STOCK, (len(item_ids), product_code)
+                )
+        except Exception as e:
+            self.logger.error(
+                f"Refund failed for {growid} ({product_code} x{len(item_ids)}): {e}"
+            )
+            raise TransactionError(
+                "Your items could not be delivered and the refund failed. "
+                "Please contact an admin."
+            )
+
     async def _process_payment(
         self,
         cursor,
         growid: str,
         balance: Balance,
-        amount: Decimal,
+        amount: int,
         product_name: str,
-        product_code: str
+        product_code: str,
+        timestamp: str
     ) -> Balance:
-        remaining = amount
-        new_balance = Balance(
-            balance.wl,
-            balance.dl,
-            balance.bgl
-        )
-        
-        # Convert from BGL if needed
-        while (
-            remaining > (new_balance.wl + new_balance.dl * CURRENCY_RATES['DL']) and 
-            new_balance.bgl > 0
-        ):
-            new_balance.bgl -= 1
-            new_balance.dl += 100
-            
-        # Convert from DL if needed    
-        while remaining > new_balance.wl and new_balance.dl > 0:
-            new_balance.dl -= 1
-            new_balance.wl += 100
-            
-        if new_balance.wl < remaining:
-            raise TransactionError("Balance conversion error")
-            
-        new_balance.wl -= int(remaining)
+        remaining = balance.total_wls - amount
+        if remaining < 0:
+            raise TransactionError("Insufficient balance")
+
+        # Normalise what is left into the largest denominations
+        bgl, remaining = divmod(remaining, WL_PER_BGL)
+        dl, wl = divmod(remaining, WL_PER_DL)
+        new_balance = Balance(wl, dl, bgl)
         
         # Update database
-        cursor.execute("""
-            UPDATE users 
-            SET balance_wl = ?, balance_dl = ?, balance_bgl = ?
-            WHERE growid = ?
-        """, (new_balance.wl, new_balance.dl, new_balance.bgl, growid))
+        await cursor.execute(
+            SQL_UPDATE_USER_BALANCE,
+            (new_balance.wl, new_balance.dl, new_balance.bgl, growid)
+        )
         
         # Log transaction
-        cursor.execute("""
-            INSERT INTO transaction_log 
-            (growid, amount, type, details, old_balance, new_balance, timestamp)
-            VALUES (?, ?, 'PURCHASE', ?, ?, ?, datetime('now'))
-        """, (
+        await cursor.execute(SQL_INSERT_PURCHASE_LOG, (
             growid,
-            int(amount),
+            amount,
             f"Purchased {product_name} ({product_code})",
-            balance.format(),
-            new_balance.format()
+            balance.wl, balance.dl, balance.bgl,
+            new_balance.wl, new_balance.dl, new_balance.bgl,
+            timestamp
         ))
         
         return new_balance
@@ -250,40 +334,90 @@ class TransactionCog(commands.Cog):
         user: discord.User,
         product_name: str,
         quantity: int,
-        price: Decimal,
+        price: int,
         balance: Balance,
-        items: List[Tuple]
+        items: List[Tuple],
+        timestamp: str
     ):
         try:
-            messages = []
-            current_msg = [
+            header = (
                 f"🛒 Purchase Details:\n"
                 f"Product: {product_name}\n"
                 f"Quantity: {quantity}\n"
                 f"Total Price: {price:,} WLs\n"
-                f"Time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                f"Your Items:\n"
-            ]
-            
-            for i, (_, content) in enumerate(items, 1):
-                item_line = f"{i}. {content}\n"
-                if len('\n'.join(current_msg)) + len(item_line) > 1900:
-                    messages.append('\n'.join(current_msg))
+                f"Time: {timestamp}\n\n"
+                f"Your Items:"
+            )
+            item_lines = (
+                f"{i}. {content}" for i, (_, content) in enumerate(items, 1)
+            )
+
+            # Pack lines into messages under the DM limit, joining each once
+            messages = []
+            current_msg = [header]
+            current_len = len(header)
+            for item_line in item_lines:
+                if current_len + 1 + len(item_line) > 1900:
+                    messages.append("\n".join(current_msg))
                     current_msg = [item_line]
+                    current_len = len(item_line)
                 else:
                     current_msg.append(item_line)
+                    current_len += 1 + len(item_line)
                     
-            if current_msg:
-                messages.append('\n'.join(current_msg))
+            messages.append("\n".join(current_msg))
             
-            for msg in messages:
-                await user.send(msg)
+            # Send in order and stop at the first failure
+            for sent, msg in enumerate(messages):
+                try:
+                    await user.send(msg)
+                except discord.HTTPException as e:
+                    if sent == 0:
+                        raise
+                    # Items already reached the buyer; rolling back would put
+                    # them on sale again, so keep the purchase and flag it
+                    self.logger.error(
+                        f"Partial DM delivery to user {user.id}: "
+                        f"{sent}/{len(messages)} messages sent: {e}"
+                    )
+                    return
                 
         except discord.Forbidden:
             self.logger.warning(f"Could not send DM to user {user.id}")
             raise TransactionError(
                 "Couldn't send items via DM. Please enable DMs and try again!"
             )
+        except discord.HTTPException as e:
+            self.logger.warning(f"DM delivery to user {user.id} failed: {e}")
+            raise TransactionError(
+                "Couldn't deliver your items via DM right now. Please try again later!"
+            )
+
+    async def _spool_attachment(self, attachment: discord.Attachment) -> str:
+        """Stream an attachment into a private temporary file and return its path"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.txt') as tmp:
+            path = tmp.name
+        try:
+            async with self.bot.session.get(attachment.url) as response:
+                response.raise_for_status()
+                async with aiofiles.open(path, 'wb') as file:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        await file.write(chunk)
+        except Exception:
+            os.remove(path)
+            raise
+        return path
+
+    async def _iter_stock_lines(self, file_path: str):
+        """Yield the non-blank lines of a local stock file"""
+        try:
+            async with aiofiles.open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+                async for raw in file:
+                    line = raw.strip()
+                    if line:
+                        yield line
+        except OSError as e:
+            raise TransactionError(f"Error reading file: {str(e)}")
 
     async def add_stock_from_file(
         self, 
@@ -291,69 +425,51 @@ class TransactionCog(commands.Cog):
         file_path: str = None
     ) -> discord.Embed:
         """Add stock from file"""
+        spooled_path = None
         try:
-            current_time = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            now = datetime.utcnow()
+            current_time = format_datetime(now)
             self.logger.info(f"Adding stock at {current_time}")
             
             if not file_path and not ctx.message.attachments:
                 raise TransactionError("No file provided!")
 
-            if not file_path and ctx.message.attachments:
-                attachment = ctx.message.attachments[0]
-                file_path = attachment.filename
-                await attachment.save(file_path)
-
-            try:
-                async with aiofiles.open(file_path, 'r', encoding='utf-8') as file:
-                    content = await file.read()
-                    lines = [line.strip() for line in content.split('\n') if line.strip()]
-            except Exception as e:
-                raise TransactionError(f"Error reading file: {str(e)}")
+            source_file = file_path or ctx.message.attachments[0].filename
 
-            if not lines:
-                raise TransactionError("File is empty!")
+            # Fetch the input before taking the writer, which every purchase shares
+            if not file_path:
+                try:
+                    spooled_path = await self._spool_attachment(ctx.message.attachments[0])
+                except Exception as e:
+                    raise TransactionError(f"Error reading file: {str(e)}")
 
+            added_count = 0
             async with self._db_transaction() as cursor:
-                # Add stock items
-                added_count = 0
-                failed_items = []
-                
-                for line in lines:
-                    try:
-                        cursor.execute("""
-                            INSERT INTO stock (
-                                content, status, added_date, added_by, source_file
-                            ) VALUES (?, 'available', ?, ?, ?)
-                        """, (line, current_time, str(ctx.author), file_path))
-                        added_count += 1
-                    except Exception as e:
-                        failed_items.append(f"{line}: {str(e)}")
+                # Insert in fixed-size batches so memory stays O(batch)
+                batch = []
+                async for line in self._iter_stock_lines(file_path or spooled_path):
+                    batch.append((line, str(ctx.author), source_file))
+                    if len(batch) >= STOCK_BATCH_SIZE:
+                        await cursor.executemany(SQL_INSERT_STOCK, batch)
+                        added_count += cursor.rowcount
+                        batch = []
+                if batch:
+                    await cursor.executemany(SQL_INSERT_STOCK, batch)
+                    added_count += cursor.rowcount
+
+            if not added_count:
+                raise TransactionError("File is empty!")
 
             embed = discord.Embed(
                 title="✅ Stock Added Successfully",
                 color=discord.Color.green(),
-                timestamp=datetime.utcnow()
+                timestamp=now
             )
             embed.add_field(name="Items Added", value=str(added_count), inline=True)
-            embed.add_field(name="Failed Items", value=str(len(failed_items)), inline=True)
-            embed.add_field(name="Source File", value=file_path, inline=True)
-            
-            if failed_items:
-                # Split failed items into chunks if too long
-                chunks = [failed_items[i:i + 10] for i in range(0, len(failed_items), 10)]
-                for i, chunk in enumerate(chunks):
-                    embed.add_field(
-                        name=f"Failed Items (Part {i+1})",
-                        value="\n".join(chunk),
-                        inline=False
-                    )
+            embed.add_field(name="Source File", value=source_file, inline=True)
                     
             embed.set_footer(text=f"Added by {ctx.author}")
 
-            # Clean up file if it was an attachment
-            if ctx.message.attachments and os.path.exists(file_path):
-                os.remove(file_path)
-
             return embed
         
         except TransactionError as e:
@@ -364,6 +480,10 @@ class TransactionCog(commands.Cog):
             self.logger.error(f"Unexpected error adding stock: {e}")
             raise TransactionError(f"An unexpected error occurred: {str(e)}")
 
+        finally:
+            if spooled_path:
+                os.remove(spooled_path)
+
     @commands.Cog.listener()
     async def on_ready(self):
         """Initialize when bot is ready"""
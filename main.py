@@ -3,23 +3,41 @@ from discord.ext import commands
 import os
 import json
 import logging
+import logging.handlers
+import queue
 import asyncio
 import aiohttp
-from database import setup_database, get_connection
-from datetime import datetime
+import sys
+from database import setup_database, get_connection, ConnectionPool
+from config import load_config
 
-# Setup logging
+# uvloop is optional; it speeds up the gateway and HTTP sockets on Linux
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Setup logging; records are queued and written to stderr by a background
+# thread so handlers never block the event loop
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+)
+log_queue = queue.SimpleQueue()
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
+log_listener = logging.handlers.QueueListener(
+    log_queue, log_handler, respect_handler_level=True
+)
+log_listener.start()
 
 logger = logging.getLogger(__name__)
 
 # Load config
 try:
-    with open('config.json', 'r') as config_file:
-        config = json.load(config_file)
+    config = load_config()
 
     # Bot configuration
     TOKEN = config['token']
@@ -39,101 +57,162 @@ except KeyError as e:
     logger.error(f"Missing required configuration key: {e}")
     raise
 
+COMMAND_PREFIX = '!'
+
 # Setup intents
 intents = discord.Intents.all()
 
+# Presence shown on every (re)connect
+WATCHING_ACTIVITY = discord.Activity(
+    type=discord.ActivityType.watching,
+    name="Growtopia Shop"
+)
+
 class MyBot(commands.Bot):
     def __init__(self):
         super().__init__(
-            command_prefix='!',
+            command_prefix=COMMAND_PREFIX,
             intents=intents,
-            help_command=None
+            help_command=None,
+            # Nothing looks members up from the cache; skip the startup sync
+            chunk_guilds_at_startup=False,
+            member_cache_flags=discord.MemberCacheFlags.none()
         )
         self.session = None
+        self.db_pool = ConnectionPool()
+        # Set once setup_database() has created the schema
+        self.db_ready = asyncio.Event()
         self.admin_id = ADMIN_ID  # Tambahkan ini
+        # Resolved once in on_ready so cogs can send without a cache lookup
+        self.live_stock_channel = None
+        self.donation_log_channel = None
 
     async def setup_hook(self):
-        self.session = aiohttp.ClientSession()
-        print(f"Current Date and Time (UTC - YYYY-MM-DD HH:MM:SS formatted): {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}")
+        # One keep-alive session for every extension's outbound HTTP
+        connector = aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=30,
+            ttl_dns_cache=300,
+            keepalive_timeout=75
+        )
+        self.session = aiohttp.ClientSession(connector=connector)
+
+        # Extensions query the schema as soon as they load
+        await self.db_ready.wait()
+        await self.db_pool.open()
         
         # Load extensions
         extensions = [
             'cogs.admin',
             'ext.live',
+            'ext.balance_manager',
             'ext.trx',
             'ext.donate',
             'ext.product_manager'
         ]
         
-        for ext in extensions:
-            try:
-                await self.load_extension(ext)
+        # Extensions only look each other up lazily, so load them concurrently
+        results = await asyncio.gather(
+            *(self.load_extension(ext) for ext in extensions),
+            return_exceptions=True
+        )
+        for ext, result in zip(extensions, results):
+            if isinstance(result, Exception):
+                logger.error(f'Failed to load {ext}: {result}')
+            else:
                 logger.info(f'Loaded extension: {ext}')
-            except Exception as e:
-                logger.error(f'Failed to load {ext}: {e}')
     
     async def close(self):
         if self.session:
             await self.session.close()
+        await self.db_pool.close()
         await super().close()
 
 bot = MyBot()
 
+# Set in on_ready; compared as a plain int on every message
+BOT_USER_ID = None
+
 @bot.event
 async def on_ready():
     """Event when bot is ready"""
+    global BOT_USER_ID
+    BOT_USER_ID = bot.user.id
+    bot.live_stock_channel = bot.get_channel(LIVE_STOCK_CHANNEL_ID)
+    bot.donation_log_channel = bot.get_channel(DONATION_LOG_CHANNEL_ID)
     logger.info(f'Bot {bot.user.name} is online!')
     logger.info(f'Guild ID: {GUILD_ID}')
     logger.info(f'Admin ID: {ADMIN_ID}')
     
     # Set custom status
-    await bot.change_presence(
-        activity=discord.Activity(
-            type=discord.ActivityType.watching,
-            name="Growtopia Shop"
-        )
-    )
+    await bot.change_presence(activity=WATCHING_ACTIVITY)
 
 @bot.event
 async def on_message(message):
     """Event when a message is received"""
-    if message.author == bot.user:
+    if message.author.id == BOT_USER_ID:
         return
         
-    logger.info(f'Message from {message.author}: {message.content}')
+    # Skip formatting entirely unless message dumps are enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('Message from %s: %s', message.author, message.content)
+
+    # Only prefixed messages can be commands
+    if not message.content.startswith(COMMAND_PREFIX):
+        return
     await bot.process_commands(message)
 
+# User-facing replies for known command errors; None means stay silent.
+# Anything else gets a generic reply so exception text never reaches chat.
+ERROR_MESSAGES = {
+    commands.errors.CommandNotFound: None,
+    commands.errors.CheckFailure: "❌ You don't have permission to use this command!",
+    commands.errors.UserInputError: "❌ Invalid command usage. Check the arguments and try again.",
+}
+DEFAULT_ERROR_MESSAGE = "❌ An internal error occurred. Please try again later."
+
 @bot.event
 async def on_command_error(ctx, error):
     """Global error handler"""
-    if isinstance(error, commands.errors.CheckFailure):
-        await ctx.send("❌ You don't have permission to use this command!")
-    elif isinstance(error, commands.errors.CommandNotFound):
-        pass
-    else:
-        logger.error(f'Error in {ctx.command}: {error}')
-        await ctx.send(f"❌ An error occurred: {str(error)}")
+    # Walk the MRO so subclasses (e.g. MissingPermissions) match their base
+    for error_type in type(error).__mro__:
+        if error_type in ERROR_MESSAGES:
+            message = ERROR_MESSAGES[error_type]
+            if message:
+                await ctx.send(message)
+            return
+
+    logger.error(f'Error in {ctx.command}: {error}')
+    await ctx.send(DEFAULT_ERROR_MESSAGE)
+
+async def init_database():
+    """Create the schema on a worker thread and signal the bot"""
+    await asyncio.to_thread(setup_database)
+    bot.db_ready.set()
 
 async def main():
     """Main function to run the bot"""
     try:
-        # Initialize database
-        setup_database()
-        
-        # Start bot
+        # Build the schema while the bot logs in
         async with bot:
-            await bot.start(TOKEN)
+            await asyncio.gather(init_database(), bot.start(TOKEN))
     except Exception as e:
         logger.error(f'Fatal error: {e}')
         raise
-    finally:
-        if not bot.is_closed():
-            await bot.close()
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        if uvloop is None:
+            asyncio.run(main())
+        elif sys.version_info >= (3, 12):
+            asyncio.run(main(), loop_factory=uvloop.new_event_loop)
+        else:
+            uvloop.install()
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info('Bot stopped by user')
     except Exception as e:
-        logger.error(f'Fatal error occurred: {e}')
\ No newline at end of file
+        logger.error(f'Fatal error occurred: {e}')
+    finally:
+        # Flush queued records before the interpreter exits
+        log_listener.stop()
\ No newline at end of file